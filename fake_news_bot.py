@@ -1,13 +1,26 @@
 import os
 import re
-import tempfile
+import sys
+import time
+import random
+import sqlite3
+import io
 import asyncio
-import requests
-from bs4 import BeautifulSoup
+import threading
+import aiohttp
+from urllib.parse import urlsplit, urlunsplit
+from collections import namedtuple
+from cachetools import LRUCache
+import sqlite_vec
+from sentence_transformers import SentenceTransformer
+from lxml import etree
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telethon import TelegramClient
+from telethon.sessions import MemorySession
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
+from google.api_core.exceptions import ResourceExhausted
 
 # ==========================================
 # CONFIGURATION
@@ -15,6 +28,11 @@ from google.generativeai.types import HarmCategory, HarmBlockThreshold
 # ==========================================
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "fact_check_cache.db")
+
+# Optional: MTProto app credentials from https://my.telegram.org enable parallel video downloads.
+TELEGRAM_API_ID = os.getenv("TELEGRAM_API_ID", "")
+TELEGRAM_API_HASH = os.getenv("TELEGRAM_API_HASH", "")
 
 # Initialize Gemini AI
 genai.configure(api_key=GEMINI_API_KEY)
@@ -42,20 +60,380 @@ Provide a response strictly in this format:
 🔍 **Context & Facts:** [Provide the actual truth, background context, or correct information regarding the topic.]
 """
 
+# One shared model for all handlers. SYSTEM_INSTRUCTION is sent as the model's system
+# instruction rather than being prepended to every prompt.
+MODEL = genai.GenerativeModel(MODEL_NAME, system_instruction=SYSTEM_INSTRUCTION, safety_settings=SAFETY_SETTINGS)
+
+# Bare model used only for counting tokens in scraped pages, without the system instruction
+TOKEN_COUNTER = genai.GenerativeModel(MODEL_NAME)
+
+# Bound concurrent Gemini calls so message bursts don't blow through the API quota,
+# and back off exponentially when we get rate limited anyway.
+GEMINI_SEMAPHORE = asyncio.Semaphore(8)
+GEMINI_MAX_ATTEMPTS = 4
+
+URL_RE = re.compile(r'https?://[^\s]+')
+
+# Scraped page text is trimmed to a Gemini token budget rather than a character count.
+# MAX_PAGE_CHARS only bounds how much text is collected before counting tokens.
+PAGE_TOKEN_BUDGET = 4000
+MAX_PAGE_CHARS = 6 * PAGE_TOKEN_BUDGET
+
+# Never download more than 2 MB of HTML, and skip links that aren't web pages at all
+MAX_PAGE_BYTES = 2_000_000
+HTML_CONTENT_TYPES = frozenset({'text/html', 'application/xhtml+xml'})
+
+# Page text comes from the title, headings and paragraphs, skipping navigation and footer boilerplate
+CONTENT_TAGS = frozenset({'title', 'h1', 'h2', 'p'})
+BOILERPLATE_TAGS = frozenset({'nav', 'footer', 'aside'})
+
+# Cap how many pages are scraped at the same time
+SCRAPE_SEMAPHORE = asyncio.BoundedSemaphore(8)
+SCRAPE_TIMEOUT = aiohttp.ClientTimeout(total=10)
+SCRAPE_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
+
+# Scraped text per normalized URL, so repeatedly forwarded links skip the fetch and parse.
+# Entries are served as-is for an hour, then revalidated with a conditional GET using the
+# page's ETag/Last-Modified so unchanged pages answer 304 without a body.
+CachedPage = namedtuple('CachedPage', ['text', 'etag', 'last_modified', 'fetched_at'])
+URL_CACHE = LRUCache(maxsize=2048)
+URL_CACHE_TTL = 3600
+# If revalidation hits a network error, timeout or 5xx, a copy up to a day old is served instead
+URL_CACHE_MAX_STALE = URL_CACHE_TTL * 24
+
+# Semantic verdict cache: near-duplicate claims in the same chat are answered from SQLite
+# instead of calling Gemini again. Messages with links only match verdicts for exactly the
+# same set of URLs. Verdicts expire after a day so fact-checks don't go stale.
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_DIMENSIONS = 384
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_TTL = 24 * 3600
+
+# Photos and videos are cached by Telegram's file_unique_id, which stays the same across forwards
+MEDIA_CACHE_TTL = 24 * 3600
+
+# Videos are fetched over MTProto as interleaved 512 KB chunks by several concurrent workers
+MTPROTO_CHUNK_SIZE = 512 * 1024
+MTPROTO_WORKERS = 4
+_mtproto_client = None
+
+_cache_db = None
+_vector_db_ready = False
+_embedder = None
+_embedder_lock = threading.Lock()
+_cache_lock = threading.Lock()
+
+# Shared HTTP session, created lazily inside the bot's event loop.
+# Keeping it alive reuses TCP/TLS connections to hosts we've already scraped.
+_http_session = None
+
 # ==========================================
 # UTILITY FUNCTIONS
 # ==========================================
-def extract_text_from_url(url: str) -> str:
-    """Scrapes paragraph text from a given URL."""
+def get_http_session() -> aiohttp.ClientSession:
+    """Returns the shared aiohttp session, creating it on first use."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(limit_per_host=8, keepalive_timeout=30)
+        _http_session = aiohttp.ClientSession(connector=connector, headers=SCRAPE_HEADERS)
+    return _http_session
+
+async def close_http_session():
+    """Closes the shared aiohttp session."""
+    if _http_session is not None:
+        await _http_session.close()
+
+def normalize_url(url: str) -> str:
+    """Builds the cache key for a URL by lowercasing the scheme and host and dropping the fragment."""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, ''))
+
+def read_content_blocks(parser: etree.HTMLPullParser, blocks: list, budget: int) -> int:
+    """Moves finished, non-empty content texts from the parser into `blocks` until `budget` characters are added."""
+    added = 0
+    for _, element in parser.read_events():
+        # Ancestors are already built during pull parsing, so boilerplate can be skipped in the same pass.
+        # Only the document <title> counts; inline <svg><title> icon labels are not page text.
+        parent = element.getparent()
+        skip = (
+            (element.tag == 'title' and (parent is None or parent.tag != 'head'))
+            or next(element.iterancestors(*BOILERPLATE_TAGS), None) is not None
+        )
+        text = '' if skip else ''.join(element.itertext()).strip()
+        element.clear(keep_tail=True)
+        if not text:
+            continue
+        blocks.append(text)
+        added += len(text) + 1
+        if added >= budget:
+            break
+    return added
+
+async def call_gemini(func, *args):
+    """Runs a blocking Gemini SDK call in a worker thread, limited by GEMINI_SEMAPHORE and retried on 429s."""
+    for attempt in range(GEMINI_MAX_ATTEMPTS):
+        try:
+            async with GEMINI_SEMAPHORE:
+                return await asyncio.to_thread(func, *args)
+        except ResourceExhausted:
+            if attempt == GEMINI_MAX_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(2 ** attempt + random.random())
+
+async def truncate_to_token_budget(blocks: list) -> tuple:
+    """Trims scraped content blocks to about PAGE_TOKEN_BUDGET tokens, cutting at block boundaries.
+
+    Returns the text and whether it was measured; an emergency cut after a failed count shouldn't be cached.
+    """
+    text = ' '.join(blocks)[:MAX_PAGE_CHARS]
+    # Every token covers at least one character, so short pages never need counting
+    if len(text) <= PAGE_TOKEN_BUDGET:
+        return text, True
+
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-        response = requests.get(url, headers=headers, timeout=10)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        paragraphs = soup.find_all('p')
-        text = ' '.join([p.get_text() for p in paragraphs])
-        return text[:15000] # Limit to 15k characters to fit within prompt context
+        tokens = (await call_gemini(TOKEN_COUNTER.count_tokens, text)).total_tokens
+    except Exception:
+        return text[:PAGE_TOKEN_BUDGET], False # Assume one character per token, so dense scripts like CJK stay in budget
+    if tokens <= PAGE_TOKEN_BUDGET:
+        return text, True
+
+    # Use this page's characters-per-token ratio from the single count to pick how much to keep
+    max_chars = len(text) * PAGE_TOKEN_BUDGET // tokens
+    kept = []
+    length = 0
+    for block in blocks:
+        if length + len(block) > max_chars:
+            break
+        kept.append(block)
+        length += len(block) + 1
+    return (' '.join(kept) if kept else text[:max_chars]), True
+
+async def extract_text_from_url(url: str) -> str:
+    """Scrapes the title, headings and paragraph text from a given URL. Raises if the page can't be fetched."""
+    cached = None
+    serve_stale = False
+    try:
+        key = normalize_url(url)
+        cached = URL_CACHE.get(key)
+        if cached is not None and time.time() - cached.fetched_at < URL_CACHE_TTL:
+            return cached.text
+        serve_stale = cached is not None and time.time() - cached.fetched_at < URL_CACHE_MAX_STALE
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+
+        async with SCRAPE_SEMAPHORE:
+            async with get_http_session().get(url, headers=headers, timeout=SCRAPE_TIMEOUT) as response:
+                if response.status == 304 and cached is not None:
+                    URL_CACHE[key] = cached._replace(fetched_at=time.time())
+                    return cached.text
+
+                # Error pages must never be parsed or cached as the article's text.
+                # Only server errors are transient; a 4xx or a non-HTML body is the page's real state,
+                # and a deleted or retracted article is something the fact-check should know about.
+                is_html = response.content_type in HTML_CONTENT_TYPES
+                if response.status < 500 and (response.status != 200 or not is_html):
+                    serve_stale = False
+                    if response.status in (404, 410):
+                        URL_CACHE.pop(key, None)
+
+                if response.status != 200:
+                    raise ValueError(f"HTTP {response.status}")
+
+                if not is_html:
+                    raise ValueError(f"unsupported content type '{response.content_type}'")
+
+                # Parse content tags as the body streams in and stop downloading once we have enough text
+                parser = etree.HTMLPullParser(events=('end',), tag=CONTENT_TAGS, encoding=response.charset)
+                blocks = []
+                length = 0
+                received = 0
+                async for chunk in response.content.iter_chunked(16 * 1024):
+                    received += len(chunk)
+                    parser.feed(chunk)
+                    length += read_content_blocks(parser, blocks, MAX_PAGE_CHARS - length)
+                    if length >= MAX_PAGE_CHARS or received >= MAX_PAGE_BYTES:
+                        break
+                else:
+                    parser.close()
+                    read_content_blocks(parser, blocks, MAX_PAGE_CHARS - length)
+
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+
+        text, measured = await truncate_to_token_budget(blocks)
+        if measured:
+            URL_CACHE[key] = CachedPage(text, etag, last_modified, time.time())
+        return text
+    except Exception:
+        # A transient revalidation failure keeps serving the last good copy instead of an error
+        if serve_stale:
+            return cached.text
+        raise
+
+def get_cache_db() -> sqlite3.Connection:
+    """Opens the verdict cache database. Callers must hold `_cache_lock`."""
+    global _cache_db
+    if _cache_db is None:
+        db = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False)
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS media_verdicts (
+                file_unique_id TEXT NOT NULL,
+                caption TEXT NOT NULL,
+                verdict TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (file_unique_id, caption)
+            );
+        """)
+        _cache_db = db
+    return _cache_db
+
+def get_vector_db() -> sqlite3.Connection:
+    """Returns the cache database with sqlite-vec loaded for the semantic cache. Callers must hold `_cache_lock`."""
+    global _vector_db_ready
+    db = get_cache_db()
+    if not _vector_db_ready:
+        db.enable_load_extension(True)
+        sqlite_vec.load(db)
+        db.enable_load_extension(False)
+        db.executescript(f"""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                id INTEGER PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                urls TEXT NOT NULL,
+                verdict TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS verdict_embeddings USING vec0(
+                chat_id INTEGER PARTITION KEY,
+                embedding FLOAT[{EMBEDDING_DIMENSIONS}] distance_metric=cosine
+            );
+        """)
+        _vector_db_ready = True
+    return db
+
+def embed_text(text: str) -> bytes:
+    """Embeds text with the local sentence-transformers model, serialized for sqlite-vec."""
+    global _embedder
+    # Loading the model can take a while on a cold start, so it mustn't hold up the SQLite lock
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    embedding = _embedder.encode(text, normalize_embeddings=True)
+    return sqlite_vec.serialize_float32(embedding.tolist())
+
+def lookup_cached_verdict(chat_id: int, urls: str, embedding: bytes):
+    """Returns the closest verdict for a near-duplicate claim with the same links in this chat, or None."""
+    with _cache_lock:
+        row = get_vector_db().execute("""
+            WITH matches AS (
+                SELECT rowid, distance FROM verdict_embeddings
+                WHERE embedding MATCH ? AND k = 5 AND chat_id = ?
+            )
+            SELECT verdicts.verdict FROM matches
+            JOIN verdicts ON verdicts.id = matches.rowid
+            WHERE matches.distance <= ? AND verdicts.urls = ? AND verdicts.created_at >= ?
+            ORDER BY matches.distance
+            LIMIT 1
+        """, (embedding, chat_id, 1 - SEMANTIC_CACHE_THRESHOLD, urls, time.time() - SEMANTIC_CACHE_TTL)).fetchone()
+    return row[0] if row else None
+
+def store_verdict(chat_id: int, urls: str, embedding: bytes, verdict: str):
+    """Saves a verdict to the semantic cache and drops entries past their TTL."""
+    now = time.time()
+    with _cache_lock:
+        db = get_vector_db()
+        expired = db.execute("SELECT id FROM verdicts WHERE created_at < ?", (now - SEMANTIC_CACHE_TTL,)).fetchall()
+        db.executemany("DELETE FROM verdict_embeddings WHERE rowid = ?", expired)
+        db.executemany("DELETE FROM verdicts WHERE id = ?", expired)
+        cursor = db.execute(
+            "INSERT INTO verdicts (chat_id, urls, verdict, created_at) VALUES (?, ?, ?, ?)",
+            (chat_id, urls, verdict, now),
+        )
+        db.execute(
+            "INSERT INTO verdict_embeddings (rowid, chat_id, embedding) VALUES (?, ?, ?)",
+            (cursor.lastrowid, chat_id, embedding),
+        )
+        db.commit()
+
+def lookup_media_verdict(file_unique_id: str, caption: str):
+    """Returns the verdict for media already analyzed with the same caption, or None."""
+    with _cache_lock:
+        row = get_cache_db().execute(
+            "SELECT verdict FROM media_verdicts WHERE file_unique_id = ? AND caption = ? AND created_at >= ?",
+            (file_unique_id, caption, time.time() - MEDIA_CACHE_TTL),
+        ).fetchone()
+    return row[0] if row else None
+
+def store_media_verdict(file_unique_id: str, caption: str, verdict: str):
+    """Saves a media verdict and drops entries past their TTL."""
+    now = time.time()
+    with _cache_lock:
+        db = get_cache_db()
+        db.execute("DELETE FROM media_verdicts WHERE created_at < ?", (now - MEDIA_CACHE_TTL,))
+        db.execute(
+            "INSERT OR REPLACE INTO media_verdicts (file_unique_id, caption, verdict, created_at) VALUES (?, ?, ?, ?)",
+            (file_unique_id, caption, verdict, now),
+        )
+        db.commit()
+
+async def start_mtproto_client():
+    """Logs the bot into MTProto for parallel downloads, if API credentials are configured."""
+    global _mtproto_client
+    if not TELEGRAM_API_ID or not TELEGRAM_API_HASH:
+        return
+    try:
+        client = TelegramClient(MemorySession(), int(TELEGRAM_API_ID), TELEGRAM_API_HASH)
+        await client.start(bot_token=TELEGRAM_TOKEN)
     except Exception as e:
-        return f"[Failed to extract webpage content: {e}]"
+        print(f"⚠️ MTProto login failed, downloading media through the Bot API only: {e}")
+        return
+    _mtproto_client = client
+
+async def stop_mtproto_client():
+    """Disconnects the MTProto client."""
+    if _mtproto_client is not None:
+        await _mtproto_client.disconnect()
+
+async def download_video_parallel(chat_id: int, message_id: int) -> bytearray:
+    """Downloads a message's video over MTProto, with each worker fetching every Nth chunk."""
+    tg_message = await _mtproto_client.get_messages(chat_id, ids=message_id)
+    document = tg_message.document
+    buffer = bytearray(document.size)
+    stride = MTPROTO_CHUNK_SIZE * MTPROTO_WORKERS
+
+    async def worker(offset: int):
+        async for chunk in _mtproto_client.iter_download(
+            document,
+            offset=offset,
+            stride=stride,
+            limit=len(range(offset, document.size, stride)),
+            chunk_size=MTPROTO_CHUNK_SIZE,
+            request_size=MTPROTO_CHUNK_SIZE,
+            file_size=document.size,
+        ):
+            buffer[offset:offset + len(chunk)] = chunk
+            offset += stride
+
+    # A TaskGroup cancels the remaining workers as soon as one fails, before we fall back to the Bot API
+    async with asyncio.TaskGroup() as workers:
+        for i in range(MTPROTO_WORKERS):
+            workers.create_task(worker(i * MTPROTO_CHUNK_SIZE))
+    return buffer
+
+async def download_media(message, media) -> bytearray:
+    """Downloads a photo or video into memory, using parallel MTProto chunks for videos when available."""
+    if message.video and _mtproto_client is not None:
+        try:
+            return await download_video_parallel(message.chat_id, message.message_id)
+        except Exception as e:
+            print(f"⚠️ Parallel download failed, falling back to the Bot API: {e}")
+    file_obj = await media.get_file()
+    return await file_obj.download_as_bytearray()
 
 # ==========================================
 # TELEGRAM HANDLERS
@@ -79,29 +457,58 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_text = update.message.text
     status_msg = await update.message.reply_text("⏳ Analyzing text...")
 
-    # Find all URLs in the message
-    urls = re.findall(r'(https?://[^\s]+)', user_text)
+    # Find all unique URLs in the message, keeping their original order
+    urls = list(dict.fromkeys(URL_RE.findall(user_text)))
     extracted_content = ""
+    scrape_failed = False
+
+    # Serve near-duplicate claims from the semantic cache before scraping or calling Gemini.
+    # The cache is only an optimization, so any failure falls through to a normal analysis.
+    chat_id = update.effective_chat.id
+    embedding = None
+    cached_verdict = None
+    try:
+        # Two articles from the same site look alike as text, so the links themselves must match exactly
+        url_key = '\n'.join(sorted({normalize_url(url) for url in urls}))
+        embedding = await asyncio.to_thread(embed_text, user_text)
+        cached_verdict = await asyncio.to_thread(lookup_cached_verdict, chat_id, url_key, embedding)
+    except Exception as e:
+        print(f"⚠️ Semantic cache lookup failed: {e}")
+    if cached_verdict is not None:
+        try:
+            await status_msg.edit_text(cached_verdict, parse_mode='Markdown')
+        except:
+            await status_msg.edit_text(cached_verdict)
+        return
 
     if urls:
         await status_msg.edit_text(f"🔗 Found {len(urls)} link(s). Extracting webpage content...")
-        for url in urls:
-            # Run blocking web scraper in a separate thread so the bot doesn't freeze
-            content = await asyncio.to_thread(extract_text_from_url, url)
+        # Scrape all links concurrently on the event loop
+        contents = await asyncio.gather(*[extract_text_from_url(url) for url in urls], return_exceptions=True)
+        for url, content in zip(urls, contents):
+            if isinstance(content, BaseException):
+                scrape_failed = True
+                content = f"[Failed to extract webpage content: {content}]"
             extracted_content += f"\n\n--- Content from {url} ---\n{content}"
 
-    prompt = f"{SYSTEM_INSTRUCTION}\n\nUser Message/Claim: {user_text}\n{extracted_content}"
+    prompt = f"User Message/Claim: {user_text}\n{extracted_content}"
 
     try:
         await status_msg.edit_text("🧠 Fact-checking with Gemini AI...")
-        model = genai.GenerativeModel(MODEL_NAME)
-        response = model.generate_content(prompt, safety_settings=SAFETY_SETTINGS)
+        response = await call_gemini(MODEL.generate_content, prompt)
         
         # Try sending with Markdown, fallback to plain text if formatting is broken
         try:
             await status_msg.edit_text(response.text, parse_mode='Markdown')
         except:
             await status_msg.edit_text(response.text)
+
+        # A verdict reached without the linked page's content must not be reused for that link
+        if embedding is not None and not scrape_failed:
+            try:
+                await asyncio.to_thread(store_verdict, chat_id, url_key, embedding, response.text)
+            except Exception as e:
+                print(f"⚠️ Failed to save verdict to the semantic cache: {e}")
             
     except Exception as e:
         await status_msg.edit_text(f"❌ An error occurred during analysis: {e}")
@@ -112,72 +519,107 @@ async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Identify media type and check size limits
     if message.photo:
-        file_obj = await message.photo[-1].get_file()
+        media = message.photo[-1]
         media_type = 'photo'
+        mime_type = 'image/jpeg'
     elif message.video:
         # Telegram Bot API limits standard downloads to 20MB
         if message.video.file_size > 20 * 1024 * 1024:
             await message.reply_text("❌ This video is too large. Telegram bots can only process files up to 20MB.")
             return
-        file_obj = await message.video.get_file()
+        media = message.video
         media_type = 'video'
+        mime_type = message.video.mime_type or 'video/mp4'
     else:
         return
 
-    status_msg = await message.reply_text(f"📥 Downloading {media_type}...")
+    caption = message.caption or "No caption provided by the user."
+
+    # Forwarded media we've already analyzed is answered without downloading or uploading it again.
+    # Cache failures are logged and the media is analyzed as usual.
+    cached_verdict = None
+    try:
+        cached_verdict = await asyncio.to_thread(lookup_media_verdict, media.file_unique_id, caption)
+    except Exception as e:
+        print(f"⚠️ Media cache lookup failed: {e}")
+    if cached_verdict is not None:
+        try:
+            await message.reply_text(cached_verdict, parse_mode='Markdown')
+        except:
+            await message.reply_text(cached_verdict)
+        return
 
-    # Download file to a temporary location
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4" if media_type == 'video' else ".jpg") as temp_file:
-        await file_obj.download_to_drive(temp_file.name)
-        temp_path = temp_file.name
+    status_msg = await message.reply_text(f"📥 Downloading {media_type}...")
 
+    gemini_file = None
     try:
+        # Download into memory and upload straight from the buffer, skipping the temp file round trip
+        media_buffer = io.BytesIO(await download_media(message, media))
+
+        # The Gemini SDK is synchronous, so run its network calls in worker threads
         await status_msg.edit_text("☁️ Uploading media to Gemini AI for analysis...")
-        gemini_file = genai.upload_file(path=temp_path)
+        gemini_file = await asyncio.to_thread(genai.upload_file, path=media_buffer, mime_type=mime_type)
 
         # Videos require processing time in Gemini's backend
         if media_type == 'video':
             await status_msg.edit_text("⚙️ Processing video frames and audio (this may take a few seconds)...")
             while gemini_file.state.name == 'PROCESSING':
                 await asyncio.sleep(3)
-                gemini_file = genai.get_file(gemini_file.name)
+                gemini_file = await asyncio.to_thread(genai.get_file, gemini_file.name)
             
             if gemini_file.state.name == 'FAILED':
                 raise Exception("Gemini failed to process the video.")
 
         await status_msg.edit_text("🧠 Analyzing media content for manipulation and context...")
         
-        caption = message.caption or "No caption provided by the user."
-        prompt = f"{SYSTEM_INSTRUCTION}\n\nHere is a {media_type} shared by the user. User's caption: '{caption}'. Please analyze the media and caption for authenticity."
+        prompt = f"Here is a {media_type} shared by the user. User's caption: '{caption}'. Please analyze the media and caption for authenticity."
 
-        model = genai.GenerativeModel(MODEL_NAME)
-        response = model.generate_content([gemini_file, prompt], safety_settings=SAFETY_SETTINGS)
+        response = await call_gemini(MODEL.generate_content, [gemini_file, prompt])
 
         try:
             await status_msg.edit_text(response.text, parse_mode='Markdown')
         except:
             await status_msg.edit_text(response.text)
-            
-        # Clean up the uploaded file from Google's servers
-        genai.delete_file(gemini_file.name)
+
+        try:
+            await asyncio.to_thread(store_media_verdict, media.file_unique_id, caption, response.text)
+        except Exception as e:
+            print(f"⚠️ Failed to save verdict to the media cache: {e}")
 
     except Exception as e:
         await status_msg.edit_text(f"❌ An error occurred: {e}")
     finally:
-        # Always clean up the local temporary file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        # Always clean up the uploaded file from Google's servers
+        if gemini_file is not None:
+            try:
+                await asyncio.to_thread(genai.delete_file, gemini_file.name)
+            except Exception as e:
+                print(f"⚠️ Failed to delete uploaded file {gemini_file.name} from Gemini: {e}")
 
 # ==========================================
 # MAIN APPLICATION
 # ==========================================
+async def post_init(app: Application):
+    """Runs once the bot's event loop has started."""
+    await start_mtproto_client()
+
+async def post_shutdown(app: Application):
+    """Releases shared resources when the bot stops."""
+    await close_http_session()
+    await stop_mtproto_client()
+
 def main():
     if TELEGRAM_TOKEN == "YOUR_TELEGRAM_BOT_TOKEN" or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY":
         print("⚠️ ERROR: Please set your TELEGRAM_TOKEN and GEMINI_API_KEY inside the script or via Environment Variables.")
         return
 
+    # Use uvloop's faster libuv-based event loop where it's available (not on Windows)
+    if sys.platform != 'win32':
+        import uvloop
+        uvloop.install()
+
     # Build the bot application
-    app = Application.builder().token(TELEGRAM_TOKEN).build()
+    app = Application.builder().token(TELEGRAM_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
 
     # Register handlers
     app.add_handler(CommandHandler("start", start_command))